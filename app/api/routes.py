@@ -1,6 +1,7 @@
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi import APIRouter, File, UploadFile, Form, Header, HTTPException
 from fastapi.responses import JSONResponse, FileResponse
 import os
+import re
 import uuid
 import shutil
 import logging
@@ -8,25 +9,49 @@ from pathlib import Path
 from typing import Optional
 
 from app.config import settings
-from app.core.clothing_generator import generate_clothing_image
+from app.core.clothing_generator import generate_clothing_images, refine_clothing_image, get_cached_latents
 from app.core.virtual_tryon import run_virtual_tryon
-from app.utils.image_utils import is_valid_image
+from app.utils.image_utils import is_valid_image, create_contact_sheet
+from app.utils.profiling import PROFILE_FILENAME, PSTATS_FILENAME, is_admin, should_profile, request_profile, profile_dir
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+def _validate_num_variants(num_variants: int):
+    if num_variants < 1 or num_variants > settings.MAX_VARIANTS:
+        raise HTTPException(400, f"num_variants must be between 1 and {settings.MAX_VARIANTS}")
+
+def _is_request_id(request_id: str) -> bool:
+    # Request ids are always uuid4().hex, anything else could escape OUTPUT_DIR
+    return re.fullmatch(r"[0-9a-f]{32}", request_id) is not None
+
+def _image_url(path: Path) -> str:
+    return f"/api/images/{path.parent.name}/{path.name}"
+
+def _clothing_filename(variant: int) -> str:
+    return "clothing.png" if variant == 0 else f"clothing_{variant}.png"
+
+def _profile_url(request_id: str) -> str:
+    return f"/api/profiles/{request_id}"
+
 @router.post("/generate-clothing")
 async def api_generate_clothing(
     prompt: str = Form(...),  # Only required field
     lora_scale: float = Form(0.7),
     steps: int = Form(30),
     guidance: float = Form(7.5),
-    seed: int = Form(42)
+    seed: int = Form(42),
+    num_variants: int = Form(1),
+    contact_sheet: bool = Form(False),
+    x_profile: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None)
 ):
     """Generate clothing image with default parameters"""
     try:
+        _validate_num_variants(num_variants)
+
         # Auto-append background requirement
         if "plain white background" not in prompt.lower():
             prompt += ", on plain white background"
@@ -34,39 +59,135 @@ async def api_generate_clothing(
         request_id = uuid.uuid4().hex
         output_dir = Path(settings.OUTPUT_DIR) / request_id
         output_dir.mkdir(parents=True, exist_ok=True)
+        profiled = should_profile(x_profile, x_admin_token)
 
-        clothing_path = output_dir / "clothing.png"
+        # First variant keeps the original filename so clothing_url is unchanged
+        clothing_paths = [output_dir / _clothing_filename(i) for i in range(num_variants)]
         
-        # Call updated generator
-        generate_clothing_image(
-            prompt=prompt,
-            output_path=str(clothing_path),
-            lora_scale=lora_scale,
-            num_steps=steps,
-            guidance_scale=guidance,
-            seed=seed
-        )
+        # All variants come from one batched pass
+        with request_profile(request_id, profiled):
+            generate_clothing_images(
+                prompt=prompt,
+                output_paths=[str(path) for path in clothing_paths],
+                lora_scale=lora_scale,
+                num_steps=steps,
+                guidance_scale=guidance,
+                seed=seed,
+                cache_key=request_id
+            )
 
-        return {
+        response = {
             "request_id": request_id,
-            "clothing_url": f"/api/images/{request_id}/clothing.png"
+            "clothing_url": _image_url(clothing_paths[0]),
+            "clothing_urls": [_image_url(path) for path in clothing_paths]
         }
 
+        if contact_sheet:
+            sheet_path = output_dir / "contact_sheet.png"
+            create_contact_sheet([str(path) for path in clothing_paths], str(sheet_path))
+            response["contact_sheet_url"] = _image_url(sheet_path)
+
+        if profiled:
+            response["profile_url"] = _profile_url(request_id)
+
+        return response
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Clothing generation error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/refine-clothing")
+async def api_refine_clothing(
+    request_id: str = Form(...),    # From previous generation or refinement
+    prompt: str = Form(...),        # Edit prompt, e.g. "navy blue t-shirt"
+    strength: float = Form(0.5),
+    variant: int = Form(0),
+    steps: int = Form(30),
+    guidance: float = Form(7.5),
+    seed: int = Form(42),
+    x_profile: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Refine a previous clothing result with a cheap img2img pass"""
+    try:
+        if not _is_request_id(request_id) or variant < 0:
+            raise HTTPException(400, "Invalid request_id or variant")
+
+        if not 0.0 < strength <= 1.0:
+            raise HTTPException(400, "strength must be greater than 0 and at most 1")
+
+        if int(steps * strength) < 1:
+            raise HTTPException(400, "steps * strength must give at least 1 denoising step; increase steps or strength")
+
+        # Prefer cached latents, fall back to the saved image
+        source_latents = get_cached_latents(request_id, variant)
+        source_path = Path(settings.OUTPUT_DIR) / request_id / _clothing_filename(variant)
+        if source_latents is None and not source_path.exists():
+            logger.error(f"Source clothing image not found: {source_path}")
+            raise HTTPException(404, "Clothing image not found")
+
+        logger.info(
+            f"Refine request: source={request_id}/{variant}, strength={strength}, "
+            f"from {'cached latents' if source_latents is not None else 'image'}"
+        )
+
+        new_request_id = uuid.uuid4().hex
+        output_dir = Path(settings.OUTPUT_DIR) / new_request_id
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiled = should_profile(x_profile, x_admin_token)
+
+        clothing_path = output_dir / "clothing.png"
+        with request_profile(new_request_id, profiled):
+            refine_clothing_image(
+                prompt=prompt,
+                output_path=str(clothing_path),
+                source_latents=source_latents,
+                source_image_path=str(source_path),
+                strength=strength,
+                num_steps=steps,
+                guidance_scale=guidance,
+                seed=seed,
+                cache_key=new_request_id
+            )
+
+        response = {
+            "request_id": new_request_id,
+            "source_request_id": request_id,
+            "clothing_url": _image_url(clothing_path)
+        }
+
+        if profiled:
+            response["profile_url"] = _profile_url(new_request_id)
+
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Clothing refinement error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Improved virtual try-on endpoint with better error logging
 @router.post("/virtual-tryon")
 async def api_virtual_tryon(
     clothing_url: str = Form(...),  # From previous generation
-    category: int = Form(0)         # Default: upper body
+    category: int = Form(0),        # Default: upper body
+    seed: int = Form(42),
+    num_variants: int = Form(1),
+    contact_sheet: bool = Form(False),
+    x_profile: bool = Header(False),
+    x_admin_token: Optional[str] = Header(None)
 ):
     """Run try-on with default parameters"""
     try:
+        _validate_num_variants(num_variants)
+
         request_id = uuid.uuid4().hex
         output_dir = Path(settings.OUTPUT_DIR) / request_id
         output_dir.mkdir(parents=True, exist_ok=True)
+        profiled = should_profile(x_profile, x_admin_token)
 
         # Process clothing URL
         path_parts = clothing_url.strip('/').split('/')
@@ -76,7 +197,7 @@ async def api_virtual_tryon(
         source_id, filename = path_parts[-2], path_parts[-1]
         source_path = Path(settings.OUTPUT_DIR) / source_id / filename
         
-        logger.info(f"Virtual try-on request: clothing={source_path}, category={category}")
+        logger.info(f"Virtual try-on request: clothing={source_path}, category={category}, variants={num_variants}")
         
         if not source_path.exists():
             logger.error(f"Source clothing image not found: {source_path}")
@@ -84,23 +205,35 @@ async def api_virtual_tryon(
         
         # Run try-on with simplified parameters
         try:
-            result_path = run_virtual_tryon(
-                model_path=str(Path(settings.DEFAULT_MODEL_PATH)),
-                clothing_path=str(source_path),
-                category=category,
-                sample_count=1,
-                scale=2.0
-            )
-            
-            logger.info(f"Virtual try-on completed successfully: {result_path}")
+            with request_profile(request_id, profiled):
+                result_paths = run_virtual_tryon(
+                    model_path=str(Path(settings.DEFAULT_MODEL_PATH)),
+                    clothing_path=str(source_path),
+                    category=category,
+                    sample_count=num_variants,
+                    scale=2.0,
+                    seed=seed,
+                    output_dir=str(output_dir)
+                )
             
-            # Get the filename from the result path
-            result_filename = Path(result_path).name
-            result_id = Path(result_path).parent.name
+            logger.info(f"Virtual try-on completed successfully: {result_paths}")
             
-            return {
-                "result_url": f"/api/images/{result_id}/{result_filename}"
+            result_paths = [Path(path) for path in result_paths]
+            response = {
+                "request_id": request_id,
+                "result_url": _image_url(result_paths[0]),
+                "result_urls": [_image_url(path) for path in result_paths]
             }
+
+            if contact_sheet:
+                sheet_path = output_dir / "contact_sheet.png"
+                create_contact_sheet([str(path) for path in result_paths], str(sheet_path))
+                response["contact_sheet_url"] = _image_url(sheet_path)
+
+            if profiled:
+                response["profile_url"] = _profile_url(request_id)
+
+            return response
         except Exception as e:
             logger.error(f"Virtual try-on process failed: {str(e)}", exc_info=True)
             raise HTTPException(500, f"Virtual try-on process failed: {str(e)}")
@@ -127,4 +260,37 @@ async def get_image(request_id: str, filename: str):
         raise
     except Exception as e:
         logger.error(f"Image retrieval error: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/profiles/{request_id}")
+async def get_profile(
+    request_id: str,
+    format: str = "chrome",
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Download the profile captured for a request (Chrome trace JSON or raw pstats)"""
+    try:
+        if not is_admin(x_admin_token):
+            raise HTTPException(status_code=403, detail="Admin token required")
+
+        if not _is_request_id(request_id):
+            raise HTTPException(status_code=400, detail="Invalid request_id")
+
+        if format not in ("chrome", "pstats"):
+            raise HTTPException(status_code=400, detail="format must be 'chrome' or 'pstats'")
+
+        filename = PROFILE_FILENAME if format == "chrome" else PSTATS_FILENAME
+        profile_path = profile_dir(request_id) / filename
+        logger.info(f"Profile request: {profile_path}")
+
+        if not profile_path.exists():
+            logger.error(f"Profile not found: {profile_path}")
+            raise HTTPException(status_code=404, detail="Profile not found")
+
+        media_type = "application/json" if format == "chrome" else "application/octet-stream"
+        return FileResponse(str(profile_path), media_type=media_type, filename=f"{request_id}_{filename}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Profile retrieval error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -10,6 +10,7 @@ class Settings(BaseSettings):
     BASE_DIR: str = str(Path(__file__).parent.parent.resolve())
     UPLOAD_DIR: str = os.path.join(BASE_DIR, "uploads")
     OUTPUT_DIR: str = os.path.join(BASE_DIR, "outputs")
+    PROFILE_DIR: str = os.path.join(BASE_DIR, "profiles")
     MODELS_DIR: str = os.path.join(BASE_DIR, "models")
     STATIC_DIR: str = os.path.join(BASE_DIR, "static")
     TEMPLATES_DIR: str = os.path.join(BASE_DIR, "templates")
@@ -19,6 +20,11 @@ class Settings(BaseSettings):
     OOTD_DIR: str = os.path.join(BASE_DIR, "OOTDiffusion")
     OOTD_RUN_SCRIPT: str = os.path.join(OOTD_DIR, "run/run_ootd.py")
     LORA_DIR: str = os.path.join(MODELS_DIR, "lora")
+    MAX_VARIANTS: int = 4
+    CACHE_LATENTS: bool = True
+    LATENT_CACHE_SIZE: int = 32
+    ADMIN_TOKEN: str = ""
+    PROFILE_SAMPLE_RATE: float = 1.0
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
 
@@ -1,61 +1,256 @@
 import os
+import time
+import logging
+import threading
+from collections import OrderedDict
 import torch
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
+from PIL import Image
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 from safetensors.torch import load_file
 
 from app.config import settings
+from app.utils.profiling import profile_stage
 
-def generate_clothing_image(
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_NEGATIVE_PROMPT = "wrinkled, dirty, worn, text, logo, brand name, person, model, mannequin, low quality, worst quality, blurry"
+
+# Resident SD 2.1 pipelines, loaded once and shared between text-to-image and img2img
+_pipeline: Optional[StableDiffusionPipeline] = None
+_img2img_pipeline: Optional[StableDiffusionImg2ImgPipeline] = None
+_pipeline_lora: Optional[str] = None
+_pipeline_lock = threading.Lock()
+
+# request_id -> final latents of each variant (on CPU), least recently used first
+_latent_cache: "OrderedDict[str, List[torch.Tensor]]" = OrderedDict()
+_latent_cache_lock = threading.Lock()
+
+def _get_pipeline(lora_path: Optional[str] = None) -> StableDiffusionPipeline:
+    """Return the resident text-to-image pipeline, loading it on first use"""
+    global _pipeline, _img2img_pipeline, _pipeline_lora
+
+    with _pipeline_lock:
+        if _pipeline is None or lora_path != _pipeline_lora:
+            # Initialize pipeline with SD 2.1
+            pipe = StableDiffusionPipeline.from_pretrained(
+                "stabilityai/stable-diffusion-2-1-base",
+                torch_dtype=torch.float16,
+            ).to("cuda")
+
+            # Load LoRA weights if provided
+            if lora_path:
+                pipe.unet.load_attn_procs(lora_path)
+
+            # Enable memory optimizations
+            try:
+                pipe.enable_xformers_memory_efficient_attention()
+            except:
+                logger.warning("xformers not available, using default attention")
+
+            _pipeline = pipe
+            _img2img_pipeline = None
+            _pipeline_lora = lora_path
+
+        return _pipeline
+
+def _get_img2img_pipeline(lora_path: Optional[str] = None) -> StableDiffusionImg2ImgPipeline:
+    """Return an img2img pipeline built from the resident pipeline's components"""
+    global _img2img_pipeline
+
+    pipe = _get_pipeline(lora_path)
+    with _pipeline_lock:
+        if _img2img_pipeline is None:
+            # Reuses the same UNet/VAE/text encoder modules, no second copy of the weights
+            _img2img_pipeline = StableDiffusionImg2ImgPipeline(**pipe.components)
+        return _img2img_pipeline
+
+def _decode_latents(pipe: StableDiffusionPipeline, latents: torch.Tensor) -> List[Image.Image]:
+    """Decode final latents to PIL images"""
+    with torch.no_grad():
+        image = pipe.vae.decode(latents / pipe.vae.config.scaling_factor, return_dict=False)[0]
+    return pipe.image_processor.postprocess(image, output_type="pil")
+
+def _cache_latents(request_id: str, latents: torch.Tensor):
+    """Keep per-variant latents for later refinement, evicting the oldest entries"""
+    with _latent_cache_lock:
+        _latent_cache[request_id] = [latent.unsqueeze(0).to("cpu") for latent in latents]
+        _latent_cache.move_to_end(request_id)
+        while len(_latent_cache) > settings.LATENT_CACHE_SIZE:
+            _latent_cache.popitem(last=False)
+
+def get_cached_latents(request_id: str, variant: int = 0) -> Optional[torch.Tensor]:
+    """Return the cached latents for a previous result, if still cached"""
+    with _latent_cache_lock:
+        variants = _latent_cache.get(request_id)
+        if variants is None or not 0 <= variant < len(variants):
+            return None
+        _latent_cache.move_to_end(request_id)
+        return variants[variant]
+
+def generate_clothing_images(
     prompt: str,
-    output_path: str,
+    output_paths: List[str],
     lora_path: Optional[str] = None,
     lora_scale: float = 0.7,
     negative_prompt: Optional[str] = None,
     num_steps: int = 30,
     guidance_scale: float = 7.5,
-    seed: int = 42
-) -> str:
-    """Simplified version matching the notebook implementation"""
+    seed: int = 42,
+    cache_key: Optional[str] = None
+) -> List[str]:
+    """Generate one variant per output path in a single batched forward pass.
+
+    Variant ``i`` is seeded with ``seed + i`` so each image is reproducible
+    and uses the same initial noise as a single-variant request with that seed.
+    When ``cache_key`` is given and latent caching is enabled, the final
+    latents are kept so the result can be refined later.
+    """
+    num_images = len(output_paths)
+    if num_images < 1:
+        raise ValueError("At least one output path is required")
+
     # Set default negative prompt
     if not negative_prompt:
-        negative_prompt = "wrinkled, dirty, worn, text, logo, brand name, person, model, mannequin, low quality, worst quality, blurry"
+        negative_prompt = DEFAULT_NEGATIVE_PROMPT
+
+    with profile_stage("sd.load_pipeline"):
+        pipe = _get_pipeline(lora_path)
+
+    # Generate enhanced prompt
+    enhanced_prompt = f"{prompt}, on plain white background"
 
-    # Initialize pipeline with SD 2.1
-    pipe = StableDiffusionPipeline.from_pretrained(
-        "stabilityai/stable-diffusion-2-1-base",
-        torch_dtype=torch.float16,
-    ).to("cuda")
+    # Create output directories
+    for output_path in output_paths:
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
-    # Load LoRA weights if provided
-    if lora_path:
-        pipe.unet.load_attn_procs(lora_path)
+    # One generator per variant gives deterministic per-variant seeds
+    generators = [
+        torch.Generator(device="cuda").manual_seed(seed + i)
+        for i in range(num_images)
+    ]
 
-    # Enable memory optimizations
-    try:
-        pipe.enable_xformers_memory_efficient_attention()
-    except:
-        print("xformers not available, using default attention")
+    # Generate all variants in one batch
+    start = time.perf_counter()
+    with profile_stage("sd.denoise", steps=num_steps, variants=num_images):
+        latents = pipe(
+            prompt=enhanced_prompt,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_steps,
+            guidance_scale=guidance_scale,
+            num_images_per_prompt=num_images,
+            generator=generators if num_images > 1 else generators[0],
+            output_type="latent"
+        ).images
+    with profile_stage("sd.decode"):
+        images = _decode_latents(pipe, latents)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Generated {num_images} variant(s) in {elapsed:.2f}s ({elapsed / num_images:.2f}s per variant)")
+
+    # Save images
+    with profile_stage("sd.save"):
+        for image, output_path in zip(images, output_paths):
+            image.save(output_path)
+            logger.info(f"Image saved to {output_path}")
+
+    if cache_key and settings.CACHE_LATENTS:
+        _cache_latents(cache_key, latents)
+
+    return list(output_paths)
+
+def refine_clothing_image(
+    prompt: str,
+    output_path: str,
+    source_latents: Optional[torch.Tensor] = None,
+    source_image_path: Optional[str] = None,
+    strength: float = 0.5,
+    lora_path: Optional[str] = None,
+    negative_prompt: Optional[str] = None,
+    num_steps: int = 30,
+    guidance_scale: float = 7.5,
+    seed: int = 42,
+    cache_key: Optional[str] = None
+) -> str:
+    """Refine a previous result with an img2img pass.
+
+    Starts from ``source_latents`` when available, which skips the VAE
+    encode, otherwise from ``source_image_path``. Only about
+    ``num_steps * strength`` denoising steps are run.
+    """
+    if source_latents is None and source_image_path is None:
+        raise ValueError("Either source_latents or source_image_path is required")
+
+    if not 0.0 < strength <= 1.0:
+        raise ValueError("strength must be in (0, 1]")
+
+    if int(num_steps * strength) < 1:
+        raise ValueError("steps * strength must be at least 1 denoising step")
+
+    # Set default negative prompt
+    if not negative_prompt:
+        negative_prompt = DEFAULT_NEGATIVE_PROMPT
+
+    with profile_stage("sd.load_pipeline"):
+        pipe = _get_img2img_pipeline(lora_path)
+
+    # 4-channel tensors are treated as latents by the img2img pipeline
+    if source_latents is not None:
+        init_image = source_latents.to(device="cuda", dtype=pipe.unet.dtype)
+    else:
+        init_image = Image.open(source_image_path).convert("RGB")
 
     # Generate enhanced prompt
     enhanced_prompt = f"{prompt}, on plain white background"
-    
-    # Create output directory
-    output_dir = Path(output_path).parent
-    output_dir.mkdir(parents=True, exist_ok=True)
-
-    # Generate image
-    image = pipe(
-        prompt=enhanced_prompt,
-        negative_prompt=negative_prompt,
-        num_inference_steps=num_steps,
-        guidance_scale=guidance_scale,
-        generator=torch.Generator(device="cuda").manual_seed(seed)
-    ).images[0]
 
-    # Save image
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with profile_stage("sd.img2img", steps=num_steps, strength=strength):
+        latents = pipe(
+            prompt=enhanced_prompt,
+            image=init_image,
+            strength=strength,
+            negative_prompt=negative_prompt,
+            num_inference_steps=num_steps,
+            guidance_scale=guidance_scale,
+            generator=torch.Generator(device="cuda").manual_seed(seed),
+            output_type="latent"
+        ).images
+    with profile_stage("sd.decode"):
+        image = _decode_latents(pipe, latents)[0]
+    elapsed = time.perf_counter() - start
+    logger.info(f"Refined image in {elapsed:.2f}s ({int(num_steps * strength)} of {num_steps} steps)")
+
     image.save(output_path)
-    print(f"Image saved to {output_path}")
-    
-    return output_path
\ No newline at end of file
+    logger.info(f"Image saved to {output_path}")
+
+    if cache_key and settings.CACHE_LATENTS:
+        _cache_latents(cache_key, latents)
+
+    return output_path
+
+def generate_clothing_image(
+    prompt: str,
+    output_path: str,
+    lora_path: Optional[str] = None,
+    lora_scale: float = 0.7,
+    negative_prompt: Optional[str] = None,
+    num_steps: int = 30,
+    guidance_scale: float = 7.5,
+    seed: int = 42,
+    cache_key: Optional[str] = None
+) -> str:
+    """Single-image convenience wrapper around generate_clothing_images"""
+    return generate_clothing_images(
+        prompt=prompt,
+        output_paths=[output_path],
+        lora_path=lora_path,
+        lora_scale=lora_scale,
+        negative_prompt=negative_prompt,
+        num_steps=num_steps,
+        guidance_scale=guidance_scale,
+        seed=seed,
+        cache_key=cache_key
+    )[0]
@@ -1,26 +1,43 @@
 import os
+import time
 import subprocess
 import logging
 from pathlib import Path
 import shutil
-from typing import Optional
+from typing import List, Optional
 
 from app.config import settings
+from app.utils.profiling import profile_stage
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# OOTDiffusion full-body ("dc") model, which handles all three categories
+MODEL_TYPE = "dc"
+
 def run_virtual_tryon(
     model_path: str,
     clothing_path: str,
     category: int = 0,
     sample_count: int = 1,
     scale: float = 2.0,
-) -> str:
-    """Run virtual try-on with extensive debugging and error handling"""
+    seed: int = 42,
+    output_dir: Optional[str] = None,
+) -> List[str]:
+    """Run virtual try-on with extensive debugging and error handling
+
+    All ``sample_count`` variants are produced by a single OOTDiffusion run
+    (``--sample``) and returned as a list of result paths, in sample order.
+    OOTDiffusion draws the whole batch from one generator seeded with
+    ``seed``, so results are reproducible for a given ``(seed, sample_count)``
+    but variant ``i`` does not match a single-variant run with any seed.
+    """
     # Validate inputs
     if category not in [0, 1, 2]:
         raise ValueError("Category must be 0 (upper), 1 (lower), or 2 (dress)")
+
+    if sample_count < 1:
+        raise ValueError("sample_count must be at least 1")
     
     # Validate file existence
     if not os.path.exists(model_path):
@@ -83,25 +100,29 @@ def run_virtual_tryon(
         "python", "run_ootd.py",
         f"--model_path \"{model_path}\"",
         f"--cloth_path \"{clothing_path}\"",
-        f"--model_type dc",
+        f"--model_type {MODEL_TYPE}",
         f"--category {category}",
         f"--scale {scale}",
         f"--sample {sample_count}",
+        f"--seed {seed}",
     ]
 
     cmd_str = " ".join(cmd)
     logger.info(f"Executing: {cmd_str}")
 
     # Execute in subshell to maintain environment
+    # Outputs older than this run are leftovers from previous requests
+    run_started = time.time()
     try:
-        result = subprocess.run(
-            cmd_str, 
-            shell=True, 
-            executable="/bin/bash", 
-            capture_output=True, 
-            text=True,
-            check=False  # Don't raise exception on non-zero return code
-        )
+        with profile_stage("ootd.worker", samples=sample_count, category=category):
+            result = subprocess.run(
+                cmd_str, 
+                shell=True, 
+                executable="/bin/bash", 
+                capture_output=True, 
+                text=True,
+                check=False  # Don't raise exception on non-zero return code
+            )
         
         if result.returncode != 0:
             logger.error(f"OOTD failed: {result.stderr}")
@@ -117,45 +138,74 @@ def run_virtual_tryon(
 
     # Find and return the result
     # Create a unique request ID directory for this result
-    request_id = Path(clothing_path).parent.name
-    api_output_dir = Path(settings.OUTPUT_DIR) / request_id
+    if output_dir:
+        api_output_dir = Path(output_dir)
+    else:
+        request_id = Path(clothing_path).parent.name
+        api_output_dir = Path(settings.OUTPUT_DIR) / request_id
     api_output_dir.mkdir(parents=True, exist_ok=True)
     
+    with profile_stage("ootd.collect_results"):
+        return _collect_results(ootd_output_dir, run_dir, current_dir, api_output_dir, run_started, sample_count)
+
+def _existing_outputs(directory: str, names: List[str]) -> List[Path]:
+    """Return the expected output files that exist in directory"""
+    return [Path(directory) / name for name in names if (Path(directory) / name).exists()]
+
+def _collect_results(
+    ootd_output_dir: str,
+    run_dir: str,
+    current_dir: str,
+    api_output_dir: Path,
+    run_started: float,
+    sample_count: int,
+) -> List[str]:
+    """Find the outputs written by this OOTDiffusion run and copy them to api_output_dir"""
+    # run_ootd.py saves sample i as out_<model_type>_<i>.png
+    expected_names = [f"out_{MODEL_TYPE}_{i}.png" for i in range(sample_count)]
+
     # Find the output files - check both with absolute and relative paths
-    result_files = list(Path(ootd_output_dir).glob("out_*.png"))
+    result_files = _existing_outputs(ootd_output_dir, expected_names)
     
     if not result_files:
         # Try looking in the working directory structure as well
         alternate_output_dir = os.path.join(current_dir, "OOTDiffusion", "run", "images_output")
         logger.info(f"No output found in {ootd_output_dir}, checking alternate path: {alternate_output_dir}")
-        result_files = list(Path(alternate_output_dir).glob("out_*.png"))
+        result_files = _existing_outputs(alternate_output_dir, expected_names)
     
     if not result_files:
         # Try looking directly in the run directory
         run_output_dir = os.path.join(run_dir, "images_output")
         logger.info(f"Still no output found, checking directory: {run_output_dir}")
-        result_files = list(Path(run_output_dir).glob("out_*.png"))
+        result_files = _existing_outputs(run_output_dir, expected_names)
         
     if not result_files:
         # Try a complete search in the OOTD directory
         logger.info(f"Searching entire OOTD directory for output...")
         for root, _, files in os.walk(settings.OOTD_DIR):
-            for file in files:
-                if file.startswith("out_") and file.endswith(".png"):
-                    result_files.append(Path(os.path.join(root, file)))
+            if expected_names[0] in files:
+                result_files = _existing_outputs(root, expected_names)
+                break
         
     if not result_files:
         logger.error(f"No output images found in directory or subdirectories")
         raise FileNotFoundError(f"No output images found after running OOTDiffusion")
     
-    # Sort by modification time and get most recent
-    result_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-    source_path = result_files[0]
-    logger.info(f"Found result file: {source_path}")
+    # Every sample must exist and be written by this run, older files belong to other requests
+    missing = [name for name in expected_names if name not in {f.name for f in result_files}]
+    stale = [str(f) for f in result_files if f.stat().st_mtime < run_started - 1]
+    if missing or stale:
+        logger.error(f"Incomplete OOTDiffusion output: missing={missing}, stale={stale}")
+        raise FileNotFoundError(f"OOTDiffusion did not write all {sample_count} output images for this run")
+    fresh_files = result_files
+    logger.info(f"Found {len(fresh_files)} result file(s): {[str(f) for f in fresh_files]}")
     
-    # Copy the file to our API output directory
-    dest_path = api_output_dir / f"result_{source_path.name}"
-    shutil.copy2(source_path, dest_path)
+    # Copy the files to our API output directory
+    dest_paths = []
+    for source_path in fresh_files:
+        dest_path = api_output_dir / f"result_{source_path.name}"
+        shutil.copy2(source_path, dest_path)
+        dest_paths.append(str(dest_path))
     
-    logger.info(f"Virtual try-on result copied to: {dest_path}")
-    return str(dest_path)
\ No newline at end of file
+    logger.info(f"Virtual try-on results copied to: {dest_paths}")
+    return dest_paths
\ No newline at end of file
@@ -79,3 +79,54 @@ def convert_image_format(
         img.save(output_path, format=output_format.upper())
     
     return output_path
+
+
+def create_contact_sheet(
+    image_paths: List[str],
+    output_path: str,
+    columns: Optional[int] = None,
+    thumb_size: Tuple[int, int] = (256, 256),
+    padding: int = 8,
+    background: Tuple[int, int, int] = (255, 255, 255)
+) -> str:
+    """
+    Combine several images into a single grid image
+    
+    Args:
+        image_paths: Paths to the images to include, in order
+        output_path: Path to save the contact sheet
+        columns: Number of columns (defaults to all images on one row, max 4)
+        thumb_size: Maximum width and height of each cell
+        padding: Space in pixels between and around cells
+        background: RGB background colour
+        
+    Returns:
+        Path to the contact sheet
+    """
+    if not image_paths:
+        raise ValueError("No images provided for contact sheet")
+    
+    if columns is None:
+        columns = min(len(image_paths), 4)
+    rows = (len(image_paths) + columns - 1) // columns
+    
+    cell_w, cell_h = thumb_size
+    sheet = Image.new(
+        "RGB",
+        (columns * cell_w + (columns + 1) * padding, rows * cell_h + (rows + 1) * padding),
+        background
+    )
+    
+    for index, image_path in enumerate(image_paths):
+        with Image.open(image_path) as img:
+            img = img.convert("RGB")
+            img.thumbnail(thumb_size, Image.LANCZOS)
+            
+            # Centre each thumbnail in its cell
+            row, col = divmod(index, columns)
+            x = padding + col * (cell_w + padding) + (cell_w - img.width) // 2
+            y = padding + row * (cell_h + padding) + (cell_h - img.height) // 2
+            sheet.paste(img, (x, y))
+    
+    sheet.save(output_path)
+    return output_path
@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import random
+import secrets
+import logging
+import cProfile
+import pstats
+import tempfile
+import contextvars
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Optional
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+from app.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILE_FILENAME = "profile.json"
+PSTATS_FILENAME = "profile.pstats"
+
+# Profiler of the request currently being handled, None when not profiling
+_current_profiler: contextvars.ContextVar = contextvars.ContextVar("current_profiler", default=None)
+
+def is_admin(admin_token: Optional[str]) -> bool:
+    """Check an admin token against settings.ADMIN_TOKEN (disabled when unset)"""
+    if not settings.ADMIN_TOKEN or not admin_token:
+        return False
+    # Compare bytes, str comparison raises TypeError on non-ASCII header values
+    return secrets.compare_digest(admin_token.encode(), settings.ADMIN_TOKEN.encode())
+
+def should_profile(profile_requested: bool, admin_token: Optional[str]) -> bool:
+    """Decide whether to profile a request: admin only, then sampled"""
+    if not profile_requested or not is_admin(admin_token):
+        return False
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+def profile_dir(request_id: str) -> Path:
+    """Directory holding a request's profile, kept apart from the public outputs"""
+    return Path(settings.PROFILE_DIR) / request_id
+
+def request_profile(request_id: str, enabled: bool):
+    """Return a profiler context for the request, or a no-op context"""
+    if not enabled:
+        return nullcontext()
+    return RequestProfiler(request_id, profile_dir(request_id))
+
+def profile_stage(name: str, **args):
+    """Time a named stage of the current request if it is being profiled"""
+    profiler = _current_profiler.get()
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, **args)
+
+class RequestProfiler:
+    """
+    Capture cProfile, torch.profiler and stage timings for one request
+
+    On exit a Chrome-trace-compatible ``profile.json`` and the raw cProfile
+    ``profile.pstats`` are written to ``output_dir``. While torch.profiler
+    runs, stages are recorded with ``record_function`` so they share the
+    operator events' clock, and their args are attached to the exported
+    annotations; otherwise they use wall-clock time.
+    """
+
+    def __init__(self, request_id: str, output_dir: Path):
+        self.request_id = request_id
+        self.output_dir = Path(output_dir)
+        self.trace_path = self.output_dir / PROFILE_FILENAME
+        self._pid = os.getpid()
+        self._events = []
+        self._stage_args = []
+        self._cprofile = cProfile.Profile()
+        self._cprofile_active = False
+        self._torch_profiler = None
+        self._torch_request = None
+        self._token = None
+        self._error = None
+
+    @contextmanager
+    def stage(self, name: str, **args):
+        if self._torch_profiler is not None:
+            # Matched to the exported user_annotation events by name and order
+            self._stage_args.append((name, args))
+            with torch.profiler.record_function(name):
+                yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self._events.append({
+                "name": name,
+                "cat": "stage",
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": "stages",
+                "args": args,
+            })
+
+    def __enter__(self):
+        self._start = time.time()
+
+        if torch is not None:
+            try:
+                activities = [torch.profiler.ProfilerActivity.CPU]
+                if torch.cuda.is_available():
+                    activities.append(torch.profiler.ProfilerActivity.CUDA)
+                torch_profiler = torch.profiler.profile(activities=activities)
+                torch_profiler.__enter__()
+                self._torch_profiler = torch_profiler
+                torch_request = torch.profiler.record_function("request")
+                torch_request.__enter__()
+                self._torch_request = torch_request
+            except Exception as e:
+                logger.warning(f"torch.profiler unavailable for request {self.request_id}: {str(e)}")
+                self._stop_torch_profiler()
+                self._torch_profiler = None
+
+        try:
+            self._cprofile.enable()
+            self._cprofile_active = True
+        except ValueError as e:
+            # Only one cProfile can run at a time, e.g. two profiled requests overlapping
+            logger.warning(f"cProfile unavailable for request {self.request_id}: {str(e)}")
+
+        # Set last so a failed start never leaves the contextvar behind
+        self._token = _current_profiler.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._cprofile_active:
+            self._cprofile.disable()
+        end = time.time()
+
+        _current_profiler.reset(self._token)
+
+        torch_events = []
+        if self._torch_profiler is not None:
+            self._stop_torch_profiler()
+        if self._torch_profiler is not None:
+            torch_events = self._export_torch_events()
+        else:
+            self._events.append({
+                "name": "request",
+                "cat": "request",
+                "ph": "X",
+                "ts": self._start * 1e6,
+                "dur": (end - self._start) * 1e6,
+                "pid": self._pid,
+                "tid": "stages",
+                "args": {"request_id": self.request_id},
+            })
+        self._error = repr(exc_value) if exc_value else None
+
+        try:
+            self._write(torch_events)
+            logger.info(f"Profile for request {self.request_id} written to {self.trace_path}")
+        except Exception as e:
+            # Never fail the request because the trace could not be saved
+            logger.error(f"Could not write profile for request {self.request_id}: {str(e)}", exc_info=True)
+
+        return False
+
+    def _stop_torch_profiler(self):
+        """Close the request span and torch.profiler, ignoring any that never started"""
+        if self._torch_request is not None:
+            self._torch_request.__exit__(None, None, None)
+        if self._torch_profiler is not None:
+            try:
+                self._torch_profiler.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Could not stop torch.profiler for request {self.request_id}: {str(e)}")
+                self._torch_profiler = None
+        self._torch_request = None
+
+    def _export_torch_events(self) -> list:
+        """Export torch.profiler operator events in Chrome trace format"""
+        fd, tmp_path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            self._torch_profiler.export_chrome_trace(tmp_path)
+            with open(tmp_path) as f:
+                trace = json.load(f)
+            events = trace.get("traceEvents", []) if isinstance(trace, dict) else trace
+            self._attach_stage_args(events)
+            return events
+        except Exception as e:
+            logger.warning(f"Could not export torch profiler trace: {str(e)}")
+            return []
+        finally:
+            os.remove(tmp_path)
+
+    def _attach_stage_args(self, events: list):
+        """Copy stage args onto their record_function annotations, in start order"""
+        annotations = sorted(
+            (event for event in events if event.get("cat") == "user_annotation"),
+            key=lambda event: event.get("ts", 0)
+        )
+        pending = list(self._stage_args)
+        for event in annotations:
+            for index, (name, args) in enumerate(pending):
+                if event.get("name") == name:
+                    event.setdefault("args", {}).update(args)
+                    del pending[index]
+                    break
+
+    def _cprofile_summary(self, limit: int = 50) -> list:
+        """Top functions by cumulative time from cProfile"""
+        if not self._cprofile_active:
+            return []
+        stats = pstats.Stats(self._cprofile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                "function": f"{filename}:{line}({func})",
+                "calls": nc,
+                "tottime": round(tt, 6),
+                "cumtime": round(ct, 6),
+            }
+            for (filename, line, func), (cc, nc, tt, ct, callers) in rows[:limit]
+        ]
+
+    def _write(self, torch_events: list):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        if self._cprofile_active:
+            self._cprofile.dump_stats(str(self.output_dir / PSTATS_FILENAME))
+
+        metadata = [{
+            "name": "process_name",
+            "ph": "M",
+            "pid": self._pid,
+            "args": {"name": f"request {self.request_id}"},
+        }]
+        trace = {
+            "traceEvents": metadata + self._events + torch_events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "request_id": self.request_id,
+                "error": self._error,
+                "cprofile_top": self._cprofile_summary(),
+            },
+        }
+        with open(self.trace_path, "w") as f:
+            json.dump(trace, f)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import time
+import argparse
+import logging
+import tempfile
+from pathlib import Path
+
+from app.core.clothing_generator import generate_clothing_images, refine_clothing_image, get_cached_latents
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def benchmark_variants(prompt, num_variants=4, num_steps=30, seed=42, output_dir=None):
+    """Time N single-variant runs against one batched N-variant run on the resident pipeline"""
+    output_dir = Path(output_dir or tempfile.mkdtemp(prefix="bench_variants_"))
+
+    # Warm-up loads the pipeline so neither side pays the load cost
+    generate_clothing_images(prompt, [str(output_dir / "warmup.png")], num_steps=num_steps, seed=seed)
+
+    start = time.perf_counter()
+    for i in range(num_variants):
+        generate_clothing_images(prompt, [str(output_dir / f"single_{i}.png")], num_steps=num_steps, seed=seed + i)
+    separate = time.perf_counter() - start
+
+    start = time.perf_counter()
+    generate_clothing_images(
+        prompt,
+        [str(output_dir / f"batched_{i}.png") for i in range(num_variants)],
+        num_steps=num_steps,
+        seed=seed
+    )
+    batched = time.perf_counter() - start
+
+    logger.info(f"{num_variants} separate requests: {separate:.2f}s total, {separate / num_variants:.2f}s per variant")
+    logger.info(f"1 batched request:    {batched:.2f}s total, {batched / num_variants:.2f}s per variant")
+    logger.info(f"Batched speedup: {separate / batched:.2f}x")
+    return {"separate_seconds": separate, "batched_seconds": batched}
+
+def benchmark_refine(prompt, edit_prompt, strength=0.5, num_steps=30, seed=42, output_dir=None):
+    """Time a full text-to-image run against an img2img refinement of the same source"""
+    output_dir = Path(output_dir or tempfile.mkdtemp(prefix="bench_refine_"))
+
+    # Warm-up loads the pipelines so neither side pays the load cost
+    generate_clothing_images(prompt, [str(output_dir / "warmup.png")], num_steps=num_steps, seed=seed)
+    refine_clothing_image(
+        edit_prompt, str(output_dir / "warmup_refined.png"),
+        source_image_path=str(output_dir / "warmup.png"), strength=strength, num_steps=num_steps, seed=seed
+    )
+
+    source_path = output_dir / "source.png"
+    generate_clothing_images(prompt, [str(source_path)], num_steps=num_steps, seed=seed, cache_key="bench_source")
+
+    # Regenerating with the edit prompt is what users do without refinement
+    start = time.perf_counter()
+    generate_clothing_images(edit_prompt, [str(output_dir / "regenerated.png")], num_steps=num_steps, seed=seed)
+    regenerate = time.perf_counter() - start
+
+    source_latents = get_cached_latents("bench_source")
+    start = time.perf_counter()
+    refine_clothing_image(
+        edit_prompt, str(output_dir / "refined.png"),
+        source_latents=source_latents, source_image_path=str(source_path),
+        strength=strength, num_steps=num_steps, seed=seed
+    )
+    refine = time.perf_counter() - start
+
+    source = "cached latents" if source_latents is not None else "image"
+    logger.info(f"Full regeneration ({num_steps} steps): {regenerate:.2f}s")
+    logger.info(f"Refinement from {source} ({int(num_steps * strength)} steps): {refine:.2f}s")
+    logger.info(f"Refinement speedup: {regenerate / refine:.2f}x")
+    return {"regenerate_seconds": regenerate, "refine_seconds": refine}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clothing generation")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    variants = subparsers.add_parser("variants", help="Batched variants vs separate requests")
+    variants.add_argument("--prompt", type=str, default="blue t-shirt with pattern")
+    variants.add_argument("--num-variants", type=int, default=4)
+    variants.add_argument("--steps", type=int, default=30)
+    variants.add_argument("--seed", type=int, default=42)
+    variants.add_argument("--output-dir", type=str, default=None)
+
+    refine = subparsers.add_parser("refine", help="Img2img refinement vs full regeneration")
+    refine.add_argument("--prompt", type=str, default="blue t-shirt with pattern")
+    refine.add_argument("--edit-prompt", type=str, default="navy t-shirt with pattern, short sleeves")
+    refine.add_argument("--strength", type=float, default=0.5)
+    refine.add_argument("--steps", type=int, default=30)
+    refine.add_argument("--seed", type=int, default=42)
+    refine.add_argument("--output-dir", type=str, default=None)
+
+    args = parser.parse_args()
+
+    if args.command == "variants":
+        benchmark_variants(args.prompt, args.num_variants, args.steps, args.seed, args.output_dir)
+    elif args.command == "refine":
+        benchmark_refine(args.prompt, args.edit_prompt, args.strength, args.steps, args.seed, args.output_dir)
+
+if __name__ == "__main__":
+    main()